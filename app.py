@@ -1,21 +1,32 @@
 import streamlit as st
 import os
 import zipfile
-import tempfile
-import fitz  # PyMuPDF
+import docx
 import pandas as pd
-import requests
+import asyncio
+import httpx
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_exponential
 from io import BytesIO
 import plotly.express as px
 import re
-import pytesseract
-from PIL import Image
+import json
+from pdf_extract import PDF_WORKERS, extract_pdf_text
 import datetime
+import time
+import hashlib
+import diskcache
 import numpy as np
+import threading
+import queue
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 
 # Page Config
 st.set_page_config(page_title="HR AI - Candidate Analyzer", layout="wide")
-st.markdown("""
+
+@st.cache_resource
+def _styles_html():
+    return """
     <style>
     body {
         background: linear-gradient(-45deg, #f5f7fa, #c3cfe2, #dfe9f3, #e2ebf0);
@@ -42,7 +53,9 @@ st.markdown("""
         border-radius: 8px;
     }
     </style>
-""", unsafe_allow_html=True)
+"""
+
+st.markdown(_styles_html(), unsafe_allow_html=True)
 
 st.title("🧠 All-in-One AI HR Assistant")
 
@@ -50,8 +63,9 @@ st.title("🧠 All-in-One AI HR Assistant")
 job_title = st.text_input("🎯 Hiring For (Job Title / Role)")
 job_description = st.text_area("📌 Job Description or Role Requirements", height=200)
 custom_threshold = st.slider("📈 Minimum Fit Score Required", 0, 100, 50)
-uploaded_files = st.file_uploader("📁 Upload candidate CVs (PDF, DOCX, TXT, scanned PDF)", type=["pdf", "docx", "txt"], accept_multiple_files=True)
+uploaded_files = st.file_uploader("📁 Upload candidate CVs (PDF, DOCX, TXT, scanned PDF, or a ZIP of PDFs)", type=["pdf", "docx", "txt", "zip"], accept_multiple_files=True)
 pasted_candidates = st.text_area("📝 Paste candidate data (separate candidates with ---)", height=300)
+skip_off_topic = st.checkbox("⚡ Skip AI analysis for CVs that mention none of the key skills", value=True)
 process_button = st.button("🚀 Analyze Candidates")
 
 api_key = st.secrets.get("OPENROUTER_API_KEY", "")
@@ -62,34 +76,187 @@ skill_map = {
     "HR Manager": ["Recruitment", "Onboarding", "HR Policies", "Employee Relations"],
 }
 
-def extract_pdf_text(pdf_path):
+def extract_docx_text(docx_bytes, display_name):
     try:
-        doc = fitz.open(pdf_path)
-        text = ""
-        for page in doc:
-            txt = page.get_text()
-            if not txt.strip():
-                pix = page.get_pixmap(dpi=300)
-                img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                txt = pytesseract.image_to_string(img)
-            text += txt + "\n"
-        return text
+        document = docx.Document(BytesIO(docx_bytes))
+        lines = [p.text for p in document.paragraphs]
+        # Resume templates often lay out skills and experience in tables, which paragraphs don't include;
+        # merged cells repeat in row.cells, hence dict.fromkeys
+        for table in document.tables:
+            lines.extend(" | ".join(dict.fromkeys(cell.text for cell in row.cells)) for row in table.rows)
+        return "\n".join(lines)
     except Exception as e:
-        return f"Error reading {os.path.basename(pdf_path)}: {str(e)}"
+        return f"Error reading {display_name}: {str(e)}"
 
-def extract_number(text):
-    match = re.search(r"\d+", text)
-    return int(match.group()) if match else np.nan
+_NUM_RE = re.compile(r"(\d+)")
 
-def extract_between(text, start_key, end_key=None):
-    try:
-        pattern = re.escape(start_key) + r"(.*?)(?=" + re.escape(end_key) + r"|$)" if end_key else re.escape(start_key) + r"(.*)"
-        match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
-        return match.group(1).strip() if match else "N/A"
-    except Exception:
-        return "N/A"
+def extract_numbers(values):
+    # One vectorized pass over a whole column; covers JSON ints as well as strings like "85%"
+    raw = pd.Series(values, dtype=object).astype(str)
+    return pd.to_numeric(raw.str.extract(_NUM_RE, expand=False), errors="coerce").to_numpy(dtype=np.float64)
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_MODEL = "mistralai/mistral-large"
+SYSTEM_PROMPT = "You are a world-class HR AI assistant. Provide structured insights and clear ranking for best-fit candidates."
+LLM_CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", "8"))
+BATCH_SIZE = 5
+MAX_CV_CHARS = 12000
+CACHE_TTL = 7 * 24 * 3600
+HTTP_RETRIES = 3
+HTTP_BACKOFF = 0.5
+MAX_RETRY_AFTER = 30
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+HTTP_MAX_CONNECTIONS = 32
+HTTP_MAX_KEEPALIVE = 16
+
+@st.cache_resource
+def get_cache():
+    # Persists across restarts so identical CVs and prompts are never re-processed
+    return diskcache.Cache(os.path.expanduser("~/.hrai_cache"))
+
+@st.cache_resource
+def get_pdf_pool():
+    # Kept alive across reruns so worker processes keep their OCR threads and Tesseract models loaded
+    return ProcessPoolExecutor(max_workers=PDF_WORKERS)
+
+cache = get_cache()
+
+def extract_pdfs(pending, on_progress):
+    # pending maps cache key -> (name, pdf_bytes); returns cache key -> extracted text
+    texts = {}
+    todo = dict(pending)
+    for attempt in range(2):
+        retry = {}
+        try:
+            pool = get_pdf_pool()
+            futures = {pool.submit(extract_pdf_text, data, name): key for key, (name, data) in todo.items()}
+        except BrokenProcessPool:
+            # A crashed worker breaks the cached executor for good; drop it so the next attempt gets a fresh one
+            get_pdf_pool.clear()
+            continue
+        # Handled in completion order so one slow scanned PDF doesn't hold up caching the rest
+        for future in as_completed(futures):
+            key = futures[future]
+            name = todo[key][0]
+            try:
+                text = future.result()
+            except BrokenProcessPool as e:
+                if attempt == 0:
+                    retry[key] = todo[key]
+                    continue
+                text = f"Error reading {name}: {str(e)}"
+            except Exception as e:
+                # A failed worker costs only its own file, like in-process errors in extract_pdf_text
+                text = f"Error reading {name}: {str(e)}"
+            texts[key] = text
+            if not text.startswith("Error reading"):
+                cache.set(key, text, expire=CACHE_TTL)
+            on_progress(len(texts), len(pending))
+        if not retry:
+            break
+        get_pdf_pool.clear()
+        todo = retry
+    for key, (name, _) in pending.items():
+        texts.setdefault(key, f"Error reading {name}: PDF worker pool unavailable")
+    return texts
+
+def cache_key(*parts):
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+# Bump when extract_pdf_text changes output so stale cached text isn't served
+PDF_EXTRACTOR_VERSION = "5"
+
+def pdf_cache_key(pdf_bytes):
+    return cache_key("pdf", PDF_EXTRACTOR_VERSION, hashlib.sha256(pdf_bytes).hexdigest())
 
-def call_openrouter_api(prompt):
+# Bump when generate_batch_prompt or CANDIDATE_SCHEMA changes so stale evaluations aren't served
+EVAL_PROMPT_VERSION = "2"
+
+def evaluation_cache_key(job_title, job_description, cv_text):
+    # Per candidate rather than per batch prompt, so a CV stays cached however the batches fall
+    return cache_key("eval", EVAL_PROMPT_VERSION, OPENROUTER_MODEL, SYSTEM_PROMPT, job_title, job_description, cv_text[:MAX_CV_CHARS])
+
+_STR = {"type": "string"}
+_STR_LIST = {"type": "array", "items": _STR}
+CANDIDATE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "candidate": {"type": "integer"},
+        "score": {"type": "integer"},
+        "match_pct": {"type": "integer"},
+        "experience": _STR,
+        "strengths": _STR_LIST,
+        "red_flags": _STR_LIST,
+        "justification": _STR,
+        "why_not": _STR,
+        "verdict": {"type": "string", "enum": ["Strong Fit", "Moderate Fit", "Not Recommended"]},
+        "hire": _STR,
+        "summary": _STR,
+    },
+    "additionalProperties": False,
+}
+CANDIDATE_SCHEMA["required"] = list(CANDIDATE_SCHEMA["properties"])
+
+def response_schema(count):
+    # Pinning the array length lets strict structured output reject a dropped or extra candidate
+    candidates = {"type": "array", "items": CANDIDATE_SCHEMA, "minItems": count, "maxItems": count}
+    return {
+        "type": "object",
+        "properties": {"candidates": candidates},
+        "required": ["candidates"],
+        "additionalProperties": False,
+    }
+
+_backoff = wait_exponential(multiplier=HTTP_BACKOFF, max=MAX_RETRY_AFTER)
+_max_attempts = stop_after_attempt(HTTP_RETRIES + 1)
+
+def retry_after_seconds(retry_state):
+    exc = retry_state.outcome.exception()
+    if isinstance(exc, httpx.HTTPStatusError):
+        retry_after = exc.response.headers.get("retry-after", "")
+        if retry_after.isdigit():
+            return float(retry_after)
+    return None
+
+def retry_wait(retry_state):
+    # Honour OpenRouter's Retry-After on 429/503 before falling back to exponential backoff
+    retry_after = retry_after_seconds(retry_state)
+    return retry_after if retry_after is not None else _backoff(retry_state)
+
+def retry_stop(retry_state):
+    # A long Retry-After (e.g. a daily quota reset) isn't worth waiting out mid-analysis
+    retry_after = retry_after_seconds(retry_state)
+    return _max_attempts(retry_state) or (retry_after is not None and retry_after > MAX_RETRY_AFTER)
+
+STREAM_REFRESH_SECS = 0.25
+
+async def read_sse_content(response, on_chunk=None, cancel=None):
+    content = ""
+    last_refresh = 0.0
+    async for line in response.aiter_lines():
+        if cancel and cancel.is_set():
+            return "API Error: cancelled"
+        # Lines without "data: " are SSE comments such as OpenRouter's keep-alive pings
+        if not line.startswith("data: "):
+            continue
+        payload = line[len("data: "):]
+        if payload == "[DONE]":
+            break
+        chunk = json.loads(payload)
+        if "error" in chunk:
+            error = chunk["error"]
+            return f"API Error: {error.get('message', error) if isinstance(error, dict) else error}"
+        # Usage/final chunks arrive with an empty choices list
+        content += (chunk.get("choices") or [{}])[0].get("delta", {}).get("content") or ""
+        # Throttled so the browser isn't sent one delta per token
+        if on_chunk and time.monotonic() - last_refresh >= STREAM_REFRESH_SECS:
+            on_chunk(content)
+            last_refresh = time.monotonic()
+    if on_chunk:
+        on_chunk(content)
+    return content or "No response"
+
+async def call_openrouter_async(client, prompt, count, sem, on_chunk=None, cancel=None):
     if not api_key:
         return "No API key configured."
     headers = {
@@ -97,22 +264,78 @@ def call_openrouter_api(prompt):
         "Content-Type": "application/json"
     }
     data = {
-        "model": "mistralai/mistral-large",
+        "model": OPENROUTER_MODEL,
         "messages": [
-            {"role": "system", "content": "You are a world-class HR AI assistant. Provide structured insights and clear ranking for best-fit candidates."},
+            {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": prompt}
-        ]
+        ],
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": "candidate_evaluations", "strict": True, "schema": response_schema(count)}
+        },
+        "stream": True
     }
     try:
-        response = requests.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=data)
-        result = response.json()
-        return result.get("choices", [{}])[0].get("message", {}).get("content", "No response")
+        async for attempt in AsyncRetrying(
+            wait=retry_wait,
+            stop=retry_stop,
+            retry=retry_if_exception_type(httpx.HTTPError),
+            reraise=True,
+        ):
+            with attempt:
+                async with sem:
+                    # Batches queued on the semaphore (or backing off) must not send their prompt after Stop
+                    if cancel and cancel.is_set():
+                        return "API Error: cancelled"
+                    async with client.stream("POST", OPENROUTER_URL, headers=headers, json=data) as response:
+                        if response.status_code in RETRY_STATUSES:
+                            response.raise_for_status()
+                        if response.status_code != 200:
+                            await response.aread()
+                            return f"API Error: {response.status_code} {response.text}"
+                        return await read_sse_content(response, on_chunk, cancel)
     except Exception as e:
         return f"API Error: {str(e)}"
 
-def generate_prompt(cv_text, job_title, job_description):
+def make_http_client():
+    # One shared client per run so TCP/TLS setup is paid once and HTTP/2 multiplexes the batches.
+    # It isn't a cache_resource: AsyncClient is bound to the event loop that asyncio.run creates.
+    # Limits go on the transport; AsyncClient ignores limits= when a transport is supplied.
+    limits = httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE)
+    # No transport-level retries: tenacity in call_openrouter_async is the single retry layer
+    transport = httpx.AsyncHTTPTransport(http2=True, limits=limits)
+    return httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(60, connect=5))
+
+async def call_openrouter_batch(prompts, on_chunk=None, on_done=None, cancel=None):
+    async def fetch(client, i, sem):
+        prompt, count = prompts[i]
+        reply = await call_openrouter_async(client, prompt, count, sem, on_chunk and (lambda text: on_chunk(i, text)), cancel)
+        if on_done:
+            on_done(i)
+        return reply
+
+    sem = asyncio.Semaphore(LLM_CONCURRENCY)
+    async with make_http_client() as client:
+        fetched = await asyncio.gather(*[fetch(client, i, sem) for i in range(len(prompts))], return_exceptions=True)
+    return [f"API Error: {str(reply)}" if isinstance(reply, Exception) else reply for reply in fetched]
+
+def run_llm_pipeline(prompts, events, cancel):
+    # Thread target: reports streaming progress and the final replies through the events queue
+    try:
+        replies = asyncio.run(call_openrouter_batch(
+            prompts,
+            on_chunk=lambda i, text: events.put(("chunk", i, text)),
+            on_done=lambda i: events.put(("batch", i)),
+            cancel=cancel,
+        ))
+    except Exception as e:
+        replies = [f"API Error: {str(e)}"] * len(prompts)
+    events.put(("done", replies))
+
+def generate_batch_prompt(cvs, job_title, job_description):
     role_skills = skill_map.get(job_title, [])
     skills_required = ", ".join(role_skills) if role_skills else "[Let AI infer skills]"
+    resumes = "\n\n".join(f"### Candidate {i+1} (name={name}):\n{cv_text[:MAX_CV_CHARS]}" for i, (name, cv_text) in enumerate(cvs))
     return f"""
 We are hiring for the role: {job_title}
 
@@ -122,92 +345,266 @@ Job Description:
 Key Skills Expected:
 {skills_required}
 
-Resume:
-{cv_text}
-
-Evaluate the following:
-1. Score out of 100 for fit.
-2. Skill Match Percentage.
-3. Experience Years.
-4. Top 3 Strengths.
-5. Red Flags or concerns.
-6. Justify role fit.
-7. If not recommended, explain why.
-8. Final Verdict: Strong Fit / Moderate Fit / Not Recommended.
-9. Provide a one-line recommendation: Should this candidate be hired or not with a reason.
-10. Summarize key insights and data extracted from resume (e.g., education, certifications, locations, tools used, etc.)
-
-Respond in structured markdown format.
+Resumes:
+{resumes}
+
+Evaluate each of the {len(cvs)} candidates above, in the same order.
+Return a single JSON object {{"candidates": [...]}} with one entry per candidate and these keys:
+- "candidate": the candidate's number from its "### Candidate N" heading (int)
+- "score": fit score out of 100 (int)
+- "match_pct": skill match percentage (int)
+- "experience": years of experience (str)
+- "strengths": top 3 strengths (list of str)
+- "red_flags": red flags or concerns (list of str)
+- "justification": why the candidate does or does not fit the role (str)
+- "why_not": if not recommended, explain why (str)
+- "verdict": one of "Strong Fit", "Moderate Fit", "Not Recommended"
+- "hire": one-line recommendation on whether to hire, with a reason (str)
+- "summary": key insights extracted from the resume, e.g. education, certifications, locations, tools used (str)
+
+Respond with JSON only: no prose, no markdown.
 """
 
+def lacks_key_skills(cv_text, job_title):
+    role_skills = skill_map.get(job_title, [])
+    if len(role_skills) < 3:
+        return False
+    cv_lower = cv_text.lower()
+    return not any(skill.lower() in cv_lower for skill in role_skills)
+
+def off_topic_entry(job_title):
+    # Stands in for an LLM evaluation when the CV has no overlap with the role's key skills
+    skills = ", ".join(skill_map.get(job_title, []))
+    return {
+        "score": 10,
+        "match_pct": 0,
+        "verdict": "Not Recommended",
+        "red_flags": [f"No mention of any key skill ({skills})"],
+        "why_not": f"The resume does not mention any of the key skills for {job_title}.",
+        "hire": "Do not hire: no overlap with the role's key skills.",
+        "summary": "Skipped AI analysis (keyword prefilter).",
+    }
+
+def unreadable_entry(message):
+    # Stands in for an LLM evaluation when extraction failed or produced no text at all
+    return {"verdict": "Unreadable", "red_flags": [message], "summary": message}
+
+SCORE_MISSING = -1
+CHART_TOP_N = 50
+
+TEXT_FIELDS = {
+    "Recommendation": "verdict",
+    "Experience (Years)": "experience",
+    "Top Strengths": "strengths",
+    "Red Flags": "red_flags",
+    "Fit Justification": "justification",
+    "Why Not Selected": "why_not",
+    "AI Recommendation": "hire",
+    "Resume Summary": "summary",
+}
+
+def parse_batch_reply(reply, count):
+    try:
+        # Some models still wrap JSON in prose or code fences
+        entries = json.loads(reply[reply.index("{"):reply.rindex("}") + 1])["candidates"]
+    except (ValueError, KeyError, TypeError):
+        entries = []
+    if not isinstance(entries, list):
+        entries = []
+    # Matched on the echoed candidate number, so a reordered reply can't swap two candidates' evaluations
+    by_number = {}
+    for e in entries:
+        number = e.get("candidate") if isinstance(e, dict) else None
+        if isinstance(number, int) and 1 <= number <= count:
+            by_number.setdefault(number, {k: v for k, v in e.items() if k != "candidate"})
+    return [by_number.get(number, {}) for number in range(1, count + 1)]
+
+def format_field(value):
+    if value is None or value == "" or value == []:
+        return "N/A"
+    if isinstance(value, list):
+        return "\n".join(f"- {v}" for v in value)
+    return str(value)
+
 # Processing Logic
 if process_button and job_description and (uploaded_files or pasted_candidates):
     with st.spinner("🤖 AI analyzing candidates. Please wait..."):
         candidates = []
 
         if uploaded_files:
-            with tempfile.TemporaryDirectory() as tmpdir:
-                for file in uploaded_files:
-                    temp_path = os.path.join(tmpdir, file.name)
-                    with open(temp_path, "wb") as f:
-                        f.write(file.read())
-                    if file.name.lower().endswith(".pdf"):
-                        text = extract_pdf_text(temp_path)
-                        candidates.append((file.name, text))
+            pdf_files = []
+            # (name, text, pdf cache key) in upload order; PDF text is filled in once extraction finishes
+            ordered = []
+            for file in uploaded_files:
+                if file.name.lower().endswith(".txt"):
+                    ordered.append((file.name, file.getvalue().decode("utf-8", errors="ignore"), None))
+                elif file.name.lower().endswith(".docx"):
+                    ordered.append((file.name, extract_docx_text(file.getvalue(), file.name), None))
+                elif file.name.lower().endswith(".pdf"):
+                    data = file.getvalue()
+                    pdf_files.append((file.name, data, pdf_cache_key(data)))
+                    ordered.append((file.name, None, pdf_files[-1][2]))
+                elif file.name.lower().endswith(".zip"):
+                    # Read members straight from the archive; nothing is extracted to disk
+                    members = []
+                    try:
+                        with zipfile.ZipFile(BytesIO(file.getvalue())) as zf:
+                            for info in zf.infolist():
+                                member = os.path.basename(info.filename)
+                                # Skip folders and macOS "._" resource forks, which also end in .pdf
+                                if info.is_dir() or member.startswith("._") or not member.lower().endswith(".pdf"):
+                                    continue
+                                try:
+                                    data = zf.read(info)
+                                except (RuntimeError, NotImplementedError, zipfile.BadZipFile) as e:
+                                    # Encrypted members, unsupported compression or a bad CRC cost only that file
+                                    st.warning(f"⚠️ Skipped {info.filename} in {file.name}: {str(e)}")
+                                    continue
+                                # The in-archive path keeps a/cv.pdf and b/cv.pdf apart as candidates
+                                members.append((info.filename, data, pdf_cache_key(data)))
+                    except zipfile.BadZipFile:
+                        # A corrupt or mislabelled archive shouldn't abort the other uploads
+                        st.warning(f"⚠️ Skipped {file.name}: not a valid ZIP archive.")
+                    else:
+                        pdf_files.extend(members)
+                        ordered.extend((name, None, key) for name, _, key in members)
+
+            texts = {key: cache.get(key) for _, _, key in pdf_files}
+            pending = {key: (name, data) for name, data, key in pdf_files if texts[key] is None}
+            if pending:
+                progress = st.progress(0.0, text="📄 Extracting CV text...")
+                texts.update(extract_pdfs(pending, lambda done, total: progress.progress(done / total, text=f"📄 Extracted {done}/{total} CVs")))
+                progress.empty()
+            candidates.extend((name, texts[key] if key else text) for name, text, key in ordered)
 
         if pasted_candidates:
             for i, chunk in enumerate(pasted_candidates.split("---")):
                 candidates.append((f"Pasted_Candidate_{i+1}.txt", chunk.strip()))
 
-        results = []
-        for name, cv_text in candidates:
-            prompt = generate_prompt(cv_text, job_title, job_description)
-            ai_response = call_openrouter_api(prompt)
-            score = extract_number(extract_between(ai_response, "Score:"))
-            rec = extract_between(ai_response, "Final Verdict:", "\n")
-            match_pct = extract_number(extract_between(ai_response, "Skill Match Percentage:"))
-            exp_years = extract_between(ai_response, "Experience Years:", "\n")
-            strengths = extract_between(ai_response, "Top 3 Strengths:", "Red Flags")
-            red_flags = extract_between(ai_response, "Red Flags", "Justify")
-            justification = extract_between(ai_response, "Justify role fit:", "If not recommended")
-            why_not = extract_between(ai_response, "If not recommended, explain why:", "Final Verdict")
-            hiring_line = extract_between(ai_response, "Provide a one-line recommendation:")
-            summary_data = extract_between(ai_response, "Summarize key insights and data extracted from resume")
-
-            results.append({
-                "Candidate": name,
-                "Score": score,
-                "Recommendation": rec,
-                "Skill Match %": match_pct,
-                "Experience (Years)": exp_years,
-                "Top Strengths": strengths,
-                "Red Flags": red_flags,
-                "Fit Justification": justification,
-                "Why Not Selected": why_not,
-                "AI Recommendation": hiring_line,
-                "Resume Summary": summary_data,
-                "Full AI Analysis": ai_response
-            })
-
-        if results:
-            df = pd.DataFrame(results)
-
-            # ✅ Fix: ensure Score column is numeric
-            df["Score"] = pd.to_numeric(df["Score"], errors="coerce")
-
-            filtered_df = df[df["Score"] >= custom_threshold]
-            best_df = df[df["Score"] == df["Score"].max()]
+        evaluations = [None] * len(candidates)
+        to_analyze = []
+        duplicates = {}
+        first_by_text = {}
+        unreadable = []
+        for idx, (name, cv_text) in enumerate(candidates):
+            # Nothing to score, so neither the keyword prefilter nor the LLM should pass judgement on it
+            if not cv_text.strip() or cv_text.startswith("Error reading"):
+                message = cv_text if cv_text.strip() else f"No text could be extracted from {name}"
+                evaluations[idx] = (unreadable_entry(message), message)
+                unreadable.append(name)
+                continue
+            if skip_off_topic and lacks_key_skills(cv_text, job_title):
+                entry = off_topic_entry(job_title)
+                evaluations[idx] = (entry, json.dumps(entry, indent=2))
+                continue
+            # Identical resumes (e.g. the same CV in two uploads) share a single evaluation
+            text_key = hashlib.sha256(cv_text.encode()).hexdigest()
+            if text_key in first_by_text:
+                duplicates[idx] = first_by_text[text_key]
+            else:
+                first_by_text[text_key] = idx
+                cached = cache.get(evaluation_cache_key(job_title, job_description, cv_text))
+                if cached is not None:
+                    evaluations[idx] = (cached, json.dumps(cached, indent=2))
+                else:
+                    to_analyze.append((idx, name, cv_text))
+
+        batches = [to_analyze[i:i + BATCH_SIZE] for i in range(0, len(to_analyze), BATCH_SIZE)]
+        prompts = [(generate_batch_prompt([(name, cv_text) for _, name, cv_text in batch], job_title, job_description), len(batch)) for batch in batches]
+        # LLM calls run on a worker thread; this thread only drains its queue into the live previews
+        ai_responses = []
+        if batches:
+            status = st.status(f"🤖 Scoring {len(to_analyze)} candidates in {len(batches)} batches...", expanded=True)
+            with status:
+                # st.status is itself an expander and Streamlit forbids nesting them, so batches get captions
+                previews = []
+                for batch in batches:
+                    st.caption(f"⏳ {', '.join(name for _, name, _ in batch)}")
+                    previews.append(st.empty())
+            events = queue.Queue()
+            cancel = threading.Event()
+            threading.Thread(target=run_llm_pipeline, args=(prompts, events, cancel), daemon=True).start()
+            finished = 0
+            started = time.monotonic()
+            try:
+                while True:
+                    try:
+                        kind, *payload = events.get(timeout=1)
+                    except queue.Empty:
+                        # Touching the UI regularly lets Streamlit deliver Stop/rerun to this thread
+                        status.update(label=f"🤖 {finished}/{len(batches)} batches scored ({time.monotonic() - started:.0f}s)...")
+                        continue
+                    if kind == "chunk":
+                        i, text = payload
+                        previews[i].code(text, language="json")
+                    elif kind == "batch":
+                        finished += 1
+                        status.update(label=f"🤖 {finished}/{len(batches)} batches scored...")
+                    else:
+                        ai_responses = payload[0]
+                        break
+            finally:
+                # On Stop or a rerun the worker thread would otherwise keep streaming (and paying for) every batch
+                cancel.set()
+            failed = sum(reply.startswith(("API Error:", "No API key")) for reply in ai_responses)
+            if failed == len(batches):
+                status.update(label="❌ All batches failed", state="error", expanded=False)
+            elif failed:
+                status.update(label=f"⚠️ {failed}/{len(batches)} batches failed", state="complete", expanded=False)
+            else:
+                status.update(label="✅ All batches scored", state="complete", expanded=False)
+
+        for batch, ai_response in zip(batches, ai_responses):
+            for (idx, _, cv_text), entry in zip(batch, parse_batch_reply(ai_response, len(batch))):
+                evaluations[idx] = (entry, json.dumps(entry, indent=2) if entry else ai_response)
+                if entry:
+                    cache.set(evaluation_cache_key(job_title, job_description, cv_text), entry, expire=CACHE_TTL)
+        for idx, original in duplicates.items():
+            evaluations[idx] = evaluations[original]
+
+        # Column-oriented so numeric fields get fixed dtypes instead of object columns
+        n = len(candidates)
+        scores = extract_numbers([entry.get("score") for entry, _ in evaluations])
+        cols = {
+            "Candidate": [],
+            "Score": np.where(np.isnan(scores), SCORE_MISSING, scores).astype(np.int32),
+            "Skill Match %": extract_numbers([entry.get("match_pct") for entry, _ in evaluations]).astype(np.float32),
+            **{column: [] for column in TEXT_FIELDS},
+        }
+        full_replies = []
+        for (name, _), (entry, reply) in zip(candidates, evaluations):
+            cols["Candidate"].append(name)
+            for column, key in TEXT_FIELDS.items():
+                cols[column].append(format_field(entry.get(key)))
+            # Kept out of the DataFrame so filters and CSV exports don't copy multi-KB replies;
+            # indexed by row position because candidate names can repeat
+            full_replies.append(reply)
+
+        if n:
+            df = pd.DataFrame(cols, columns=["Candidate", "Score", "Recommendation", "Skill Match %", *list(TEXT_FIELDS)[1:]])
+
+            scores = df["Score"].values
+            filtered_mask = scores >= custom_threshold
+            best_mask = (scores == scores.max()) & (scores != SCORE_MISSING)
+            filtered_df = df[filtered_mask]
+            best_df = df[best_mask]
 
             st.success("✅ AI Analysis Complete")
+            if unreadable:
+                st.error(f"❌ {len(unreadable)} CV(s) could not be read and were not scored: {', '.join(unreadable)}")
             st.subheader("📊 Candidate Insights Dashboard")
             st.markdown(f"**🧑‍💼 {len(filtered_df)} candidates meet the criteria.**")
 
-            st.plotly_chart(px.bar(filtered_df, x="Candidate", y="Score", color="Recommendation", text="Score"), use_container_width=True)
-            st.plotly_chart(px.pie(filtered_df, names="Recommendation"), use_container_width=True)
-            st.plotly_chart(px.bar(filtered_df, x="Candidate", y="Skill Match %", color="Skill Match %"), use_container_width=True)
+            # Charts get pre-aggregated / top-N data so the browser isn't sent every row
+            top = filtered_df.nlargest(CHART_TOP_N, "Score")[["Candidate", "Score", "Recommendation", "Skill Match %"]]
+            rec_counts = filtered_df["Recommendation"].value_counts().reset_index()
+            st.plotly_chart(px.bar(top, x="Candidate", y="Score", color="Recommendation", text="Score"), use_container_width=True, theme=None)
+            st.plotly_chart(px.pie(rec_counts, names="Recommendation", values="count"), use_container_width=True, theme=None)
+            st.plotly_chart(px.bar(top, x="Candidate", y="Skill Match %", color="Skill Match %"), use_container_width=True, theme=None)
 
-            for _, row in filtered_df.iterrows():
-                with st.expander(f"📌 {row['Candidate']} — Score: {row['Score']} — {row['Recommendation']}"):
+            for pos, row, is_best in zip(filtered_df.index, filtered_df.to_dict(orient="records"), best_mask[filtered_mask]):
+                badge = "🌟" if is_best else "📌"
+                with st.expander(f"{badge} {row['Candidate']} — Score: {row['Score']} — {row['Recommendation']}"):
                     st.markdown(f"### 🟢 AI Recommendation: {row['AI Recommendation']}")
                     st.markdown(f"**Top Strengths**:\n{row['Top Strengths']}")
                     st.markdown(f"**Red Flags**:\n{row['Red Flags']}")
@@ -216,11 +613,18 @@ if process_button and job_description and (uploaded_files or pasted_candidates):
                     st.markdown(f"**Skill Match %**: {row['Skill Match %']} | **Experience**: {row['Experience (Years)']}")
                     st.markdown(f"**📌 Resume Summary**:\n{row['Resume Summary']}")
                     with st.expander("📄 Full AI Response"):
-                        st.code(row["Full AI Analysis"], language="markdown")
+                        st.code(full_replies[pos], language="json")
 
             timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M")
             st.download_button("📥 Download All Filtered Candidates", data=filtered_df.to_csv(index=False).encode("utf-8"), file_name=f"Filtered_Candidates_{timestamp}.csv", mime="text/csv")
             st.download_button("🌟 Download Best Candidate(s)", data=best_df.to_csv(index=False).encode("utf-8"), file_name=f"Best_Candidate_{timestamp}.csv", mime="text/csv")
+
+            transcripts = BytesIO()
+            with zipfile.ZipFile(transcripts, "w", zipfile.ZIP_DEFLATED) as zf:
+                for pos, (name, reply) in enumerate(zip(df["Candidate"], full_replies), start=1):
+                    # Numbered so repeated names (or ZIP paths) can't collide inside the archive
+                    zf.writestr(f"{pos:03d}_{os.path.splitext(name)[0].replace('/', '_')}.txt", reply)
+            st.download_button("📄 Download Full AI Transcripts", data=transcripts.getvalue(), file_name=f"AI_Transcripts_{timestamp}.zip", mime="application/zip")
 else:
     if process_button:
         st.error("⚠️ Please fill in the job title, description, and candidate data.")
@@ -0,0 +1,104 @@
+import os
+
+# Each Tesseract call would otherwise spin up its own OpenMP team on top of our OCR threads
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+from tesserocr import PyTessBaseAPI, OEM, PSM
+
+# Kept out of app.py so PDF pool workers import only this module, never the Streamlit script;
+# that keeps extraction working under the spawn/forkserver start methods as well as fork.
+
+PDF_WORKERS = min(os.cpu_count() or 1, 4)
+# Tesseract releases the GIL, so OCR threads share the cores left per PDF worker
+OCR_THREADS = max(2, (os.cpu_count() or 1) // PDF_WORKERS)
+OCR_DPI = 200
+OCR_RETRY_DPI = 300
+OCR_MIN_CHARS = 40
+
+_ocr_local = threading.local()
+_ocr_pool = None
+
+def get_ocr_pool():
+    # Long-lived per worker process so the thread-local Tesseract handles survive between PDFs
+    global _ocr_pool
+    if _ocr_pool is None:
+        _ocr_pool = ThreadPoolExecutor(max_workers=OCR_THREADS)
+    return _ocr_pool
+
+def get_ocr_api():
+    # PyTessBaseAPI is not thread-safe, so each OCR thread keeps its own resident instance
+    api = getattr(_ocr_local, "api", None)
+    if api is None:
+        api = _ocr_local.api = PyTessBaseAPI(lang="eng", oem=OEM.LSTM_ONLY, psm=PSM.SINGLE_BLOCK)
+    return api
+
+def ocr_image(img):
+    api = get_ocr_api()
+    api.SetImage(img)
+    return api.GetUTF8Text()
+
+def ocr_pixmap(pix):
+    return ocr_image(preprocess_for_ocr(pix))
+
+def preprocess_for_ocr(pix):
+    # CLAHE + Otsu on the grayscale render so Tesseract gets a clean binary image
+    gray = np.frombuffer(pix.samples, np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+    gray = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
+    _, bw = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    return Image.fromarray(bw)
+
+OCR_MIN_ALPHA_RATIO = 0.5
+# Below this many letters a page has essentially no native text, so a sharper re-render is worth it
+OCR_RETRY_MAX_NATIVE_ALPHA = 5
+
+def alpha_count(txt):
+    return sum(c.isalpha() for c in txt)
+
+def needs_ocr(txt):
+    # Scanned pages often yield a few junk glyphs rather than nothing, so gate on length and letter ratio
+    chars = "".join(txt.split())
+    if len(chars) < OCR_MIN_CHARS:
+        return True
+    return alpha_count(chars) / len(chars) < OCR_MIN_ALPHA_RATIO
+
+def table_markdown(page):
+    # Markdown tables keep the row/column structure that plain extraction flattens
+    try:
+        return "\n".join(t.to_markdown() for t in page.find_tables().tables)
+    except Exception:
+        return ""
+
+def extract_pdf_text(pdf_bytes, display_name):
+    try:
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        pages = [page.get_text() for page in doc]
+        native = list(pages)
+        # Rendering stays on this thread; Tesseract releases the GIL so scanned pages OCR in parallel
+        pending = [i for i, txt in enumerate(pages) if needs_ocr(txt)]
+        # 200 DPI is enough for most scans; only blank pages that still come back near-empty are re-rendered at 300
+        for dpi in (OCR_DPI, OCR_RETRY_DPI):
+            if not pending:
+                break
+            pixmaps = [doc[i].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY) for i in pending]
+            for i, txt in zip(pending, get_ocr_pool().map(ocr_pixmap, pixmaps)):
+                # Short or digit-heavy native text is often genuine, so OCR only wins when it recovers more letters
+                if alpha_count(txt) > alpha_count(pages[i]):
+                    pages[i] = txt
+            pending = [
+                i for i in pending
+                if alpha_count(native[i]) < OCR_RETRY_MAX_NATIVE_ALPHA and len(pages[i].strip()) < OCR_MIN_CHARS
+            ]
+        tables = [table_markdown(doc[i]) for i in range(len(pages)) if pages[i] is native[i]]
+        text = "".join(txt + "\n" for txt in pages)
+        # Tables go after the full page text so the prompt's MAX_CV_CHARS cap trims them, not the resume body
+        tables = "\n".join(md for md in tables if md)
+        return text + "\nTables:\n" + tables + "\n" if tables else text
+    except Exception as e:
+        return f"Error reading {display_name}: {str(e)}"